@@ -1,15 +1,39 @@
 import os
 import sys
-import json
 import datetime
-import glob
+import logging
+import queue
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import orjson
 
 # Import utilities
 sys.path.append('utils')
 from extractor import extract_sections
 from ranker import rank_sections
 
+log = logging.getLogger('challenge1b')
+logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+
+
+def _writer_loop(writer_q):
+    """
+    Write (path, payload) jobs from the queue until a None sentinel arrives.
+    Keeps per-PDF file IO off the extraction loop.
+    """
+    while True:
+        job = writer_q.get()
+        if job is None:
+            break
+        path, payload = job
+        try:
+            with open(path, 'wb') as f:
+                f.write(payload)
+        except OSError as e:
+            log.warning(f"   ⚠️  Could not write {path}: {e}")
+
 
 def process_hackathon_input():
     """
@@ -18,100 +42,119 @@ def process_hackathon_input():
     """
     input_dir = '/app/input'
     output_dir = '/app/output'
+    run_timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
     
     # Fall back to local development if not in Docker
     if not os.path.exists(input_dir):
-        print("Docker environment not detected, using local Collection 1...")
+        log.info("Docker environment not detected, using local Collection 1...")
         return process_local_collection()
     
     os.makedirs(output_dir, exist_ok=True)
     
-    print("CHALLENGE 1B: BERT Document Ranking")
-    print("=" * 50)
-    print(f"Input directory: {input_dir}")
-    print(f"Output directory: {output_dir}")
+    log.info("CHALLENGE 1B: BERT Document Ranking")
+    log.info("=" * 50)
+    log.info(f"Input directory: {input_dir}")
+    log.info(f"Output directory: {output_dir}")
     
     # Look for configuration file
     config_path = os.path.join(input_dir, 'challenge1b_input.json')
     if not os.path.exists(config_path):
-        print("No configuration file found, using defaults...")
+        log.info("No configuration file found, using defaults...")
         # Default configuration for BERT
-        config = {
+        spec = {
             "persona": {"role": "Document Analyst"},
             "job_to_be_done": {"task": "Rank document sections by relevance using BERT"},
             "documents": []
         }
     else:
-        with open(input_json_path, 'r', encoding='utf-8') as f:
-            spec = json.load(f)
+        with open(config_path, 'rb') as f:
+            spec = orjson.loads(f.read())
     
     # Find all PDF files in input directory
-    pdf_files = glob.glob(os.path.join(input_dir, '*.pdf'))
+    with os.scandir(input_dir) as entries:
+        pdf_files = sorted(
+            (entry for entry in entries
+             if entry.name.lower().endswith('.pdf') and not entry.name.startswith('.') and entry.is_file()),
+            key=lambda entry: entry.name
+        )
     if not pdf_files:
-        print("❌ No PDF files found in input directory!")
+        log.error("❌ No PDF files found in input directory!")
         return False
     
-    print(f"📄 Found {len(pdf_files)} PDF files to process")
+    log.info(f"📄 Found {len(pdf_files)} PDF files to process")
     
     # Update spec with found PDFs if documents list is empty
     if not spec.get('documents'):
-        spec['documents'] = [{'filename': os.path.basename(pdf)} for pdf in pdf_files]
+        spec['documents'] = [{'filename': entry.name} for entry in pdf_files]
     
     persona = spec['persona']['role']
     job = spec['job_to_be_done']['task']
     
-    print(f"🧑‍💼 Persona: {persona}")
-    print(f"📋 Task: {job}")
-    print("=" * 80)
+    log.info(f"🧑‍💼 Persona: {persona}")
+    log.info(f"📋 Task: {job}")
+    log.info("=" * 80)
     
     start_time = time.time()
     all_sections = []
     processed_files = []
     
-    # Process each PDF with BERT-optimized extraction
-    print("🚀 Initializing BERT System...")
-    for pdf_path in pdf_files:
-        filename = os.path.basename(pdf_path)
-        print(f"📄 Processing: {filename}")
-        
-        try:
-            sections = extract_sections(pdf_path)
-            
-            # Add document name to each section
-            for sec in sections:
-                sec['document'] = filename
-            all_sections.extend(sections)
-            
-            # Create individual JSON file for this PDF
-            pdf_name = os.path.splitext(filename)[0]
-            individual_output = {
-                'document': filename,
-                'sections_extracted': len(sections),
-                'processing_method': 'BERT-optimized extraction',
-                'sections': sections[:15]  # Top 15 sections for individual file
-            }
-            
-            individual_json_path = os.path.join(output_dir, f'{pdf_name}.json')
-            with open(individual_json_path, 'w', encoding='utf-8') as f:
-                json.dump(individual_output, f, ensure_ascii=False, indent=2)
-            
-            processed_files.append(filename)
-            print(f"   ✅ Extracted {len(sections)} sections")
+    # Process PDFs in parallel worker processes (CPU-bound, sidesteps the GIL)
+    log.info("🚀 Initializing BERT System...")
+    extracted = {}
+    writer_q = queue.Queue()
+    writer_thread = threading.Thread(target=_writer_loop, args=(writer_q,), daemon=True)
+    writer_thread.start()
+    max_workers = min(os.cpu_count() or 1, len(pdf_files), 8)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(extract_sections, entry.path, document_name=entry.name, workers=1): entry.name
+            for entry in pdf_files
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            log.info(f"📄 Processing: {filename}")
             
-        except Exception as e:
-            print(f"   ❌ Error processing {filename}: {e}")
-            continue
+            try:
+                sections = future.result()
+                extracted[filename] = sections
+                
+                # Serialize this PDF's JSON straight to bytes for the writer thread
+                pdf_name = filename[:-4]
+                individual_json_path = os.path.join(output_dir, f'{pdf_name}.json')
+                payload = orjson.dumps({
+                    'document': filename,
+                    'sections_extracted': len(sections),
+                    'processing_method': 'BERT-optimized extraction',
+                    'sections': sections[:15]  # Top 15 sections for individual file
+                }, option=orjson.OPT_INDENT_2)
+                writer_q.put((individual_json_path, payload))
+                
+                log.info(f"   ✅ Extracted {len(sections)} sections")
+                
+            except Exception as e:
+                log.error(f"   ❌ Error processing {filename}: {e}")
+                continue
+    
+    # Drain pending per-PDF writes
+    writer_q.put(None)
+    writer_thread.join()
+    
+    # Collect in listing order so ranking and metadata stay deterministic
+    for entry in pdf_files:
+        if entry.name in extracted:
+            processed_files.append(entry.name)
+            all_sections.extend(extracted[entry.name])
     
     extraction_time = time.time() - start_time
-    print(f"\n📊 Total sections extracted: {len(all_sections)}")
-    print(f"⏱️  Extraction time: {extraction_time:.2f} seconds")
+    log.info(f"\n📊 Total sections extracted: {len(all_sections)}")
+    log.info(f"⏱️  Extraction time: {extraction_time:.2f} seconds")
     
     if not all_sections:
-        print("❌ No sections extracted from any documents")
+        log.error("❌ No sections extracted from any documents")
         return False
     
     # Rank sections with BERT
-    print("🧠 Ranking sections with BERT...")
+    log.info("🧠 Ranking sections with BERT...")
     ranking_start = time.time()
     
     ranked_sections, subsections = rank_sections(all_sections, persona, job)
@@ -119,8 +162,8 @@ def process_hackathon_input():
     ranking_time = time.time() - ranking_start
     total_time = time.time() - start_time
     
-    print(f"⏱️  BERT ranking time: {ranking_time:.2f} seconds")
-    print(f"🚀 Processing speed: {len(all_sections)/ranking_time:.1f} sections/second")
+    log.info(f"⏱️  BERT ranking time: {ranking_time:.2f} seconds")
+    log.info(f"🚀 Processing speed: {len(all_sections)/ranking_time:.1f} sections/second")
     
     # Create consolidated output.json with BERT metadata
     output_data = {
@@ -134,7 +177,7 @@ def process_hackathon_input():
         'metadata': {
             'persona': persona,
             'job_to_be_done': job,
-            'processing_timestamp': datetime.datetime.now().isoformat(),
+            'processing_timestamp': run_timestamp,
             'processed_files': processed_files,
             'total_files': len(processed_files),
             'total_sections': len(all_sections),
@@ -149,39 +192,36 @@ def process_hackathon_input():
     }
     
     output_json_path = os.path.join(output_dir, 'output.json')
-    with open(output_json_path, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    with open(output_json_path, 'wb') as f:
+        f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2))
     
-    print(f"\n💾 Output written to: {output_json_path}")
-    print(f"📝 Total ranked sections: {len(ranked_sections)}")
+    log.info(f"\n💾 Output written to: {output_json_path}")
+    log.info(f"📝 Total ranked sections: {len(ranked_sections)}")
     
-    # Print top 3 sections summary
-    print(f"\n📋 TOP 3 BERT RANKED SECTIONS:")
-    for i, section in enumerate(ranked_sections[:3], 1):
-        document = section.get('document', 'Unknown')
-        title = section.get('section_title', 'Untitled')
-        page = section.get('page_number', 'N/A')
-        print(f"{i}. [{document}] {title} (Page {page})")
+    # Print top 3 sections summary (cosmetic - skipped when not a terminal)
+    if sys.stdout.isatty():
+        log.info(f"\n📋 TOP 3 BERT RANKED SECTIONS:")
+        for i, section in enumerate(ranked_sections[:3], 1):
+            document = section.get('document', 'Unknown')
+            title = section.get('section_title', 'Untitled')
+            page = section.get('page_number', 'N/A')
+            log.info(f"{i}. [{document}] {title} (Page {page})")
     
-    print(f"\n🎉 Challenge 1B BERT completed! Processed {len(processed_files)} files.")
-    print(f"📈 Performance: {len(all_sections)} sections in {total_time:.2f}s")
-    print(f"🏆 Model: RoBERTa-Base (~500MB, constraint compliant)")
+    log.info(f"\n🎉 Challenge 1B BERT completed! Processed {len(processed_files)} files.")
+    log.info(f"📈 Performance: {len(all_sections)} sections in {total_time:.2f}s")
+    log.info(f"🏆 Model: RoBERTa-Base (~500MB, constraint compliant)")
     
     return True
 
 def process_local_collection():
     """
     Fallback to process local Collection 1 if not in Docker environment.
+    Reuses run_collection.process_collection directly.
     """
-    print("💻 Running in local mode...")
-    from run_collection import main as collection_main
-    import sys
-    sys.argv = ['run_collection.py', '--collection', '1']  # Simulate command line
-    try:
-        collection_main()
-        return True
-    except:
-        return False
+    log.info("💻 Running in local mode...")
+    from run_collection import process_collection
+    collection_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Collection 1')
+    return process_collection(collection_path)
 
 def main():
     """
@@ -190,10 +230,10 @@ def main():
     try:
         success = process_hackathon_input()
         if not success:
-            print("❌ Processing failed!")
+            log.error("❌ Processing failed!")
             sys.exit(1)
     except Exception as e:
-        print(f"💥 Fatal error: {e}")
+        log.error(f"💥 Fatal error: {e}")
         import traceback
         traceback.print_exc()
         sys.exit(1)
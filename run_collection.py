@@ -1,100 +1,140 @@
 import os
-import json
 import time
 import argparse
 import datetime
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 
+import orjson
+
 # Import our utility modules
 import sys
 sys.path.append('utils')
 
 from extractor import extract_sections
-from ranker import rank_sections
+from ranker import encode_query, rank_sections
+
+log = logging.getLogger('challenge1b')
+logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
 
 
-def process_collection(collection_path, args=None):
+def process_collection(collection_path, args=None, tokenizer=None, model=None, timestamp=None):
     """
     Process a single document collection using BERT ranking.
     
     Args:
         collection_path: Path to collection directory
         args: Command line arguments (optional)
+        tokenizer: Preloaded tokenizer (optional, loaded on demand otherwise)
+        model: Preloaded BERT model (optional, loaded on demand otherwise)
+        timestamp: Run timestamp for the output metadata (optional, defaults to now)
         
     Returns:
         bool: True if processing successful, False otherwise
     """
     collection_name = os.path.basename(collection_path)
-    print(f"\n=== CHALLENGE 1B: {collection_name.upper()} ===")
-    print("BERT-based Document Ranking System")
-    print("-" * 60)
+    log.info(f"\n=== CHALLENGE 1B: {collection_name.upper()} ===")
+    log.info("BERT-based Document Ranking System")
+    log.info("-" * 60)
     
     # Load collection configuration
     input_file = os.path.join(collection_path, "challenge1b_input.json")
     
     if not os.path.exists(input_file):
-        print(f"ERROR: Input file not found: {input_file}")
+        log.error(f"ERROR: Input file not found: {input_file}")
         return False
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            input_data = json.load(f)
+        with open(input_file, 'rb') as f:
+            input_data = orjson.loads(f.read())
     except Exception as e:
-        print(f"ERROR: Could not read input file: {e}")
+        log.error(f"ERROR: Could not read input file: {e}")
         return False
     
     # Display scenario information
-    print(f"Challenge: {input_data['challenge_info']['description']}")
-    print(f"Persona: {input_data['persona']['role']}")
-    print(f"Task: {input_data['job_to_be_done']['task']}")
-    print("-" * 60)
+    log.info(f"Challenge: {input_data['challenge_info']['description']}")
+    log.info(f"Persona: {input_data['persona']['role']}")
+    log.info(f"Task: {input_data['job_to_be_done']['task']}")
+    log.info("-" * 60)
     
     # Process PDF documents
     pdf_directory = os.path.join(collection_path, "PDFs")
     all_sections = []
+    total_chars = 0
     
-    print("Loading BERT system...")
+    log.info("Loading BERT system...")
     start_time = time.time()
     
+    pdf_paths = {}
     for document in input_data['documents']:
         pdf_path = os.path.join(pdf_directory, document['filename'])
-        print(f"\nProcessing: {document['title']}")
-        
         if os.path.exists(pdf_path):
-            try:
-                sections = extract_sections(pdf_path)
-                # Tag each section with source document
-                for section in sections:
-                    section['document'] = document['filename']
-                print(f"  -> Extracted {len(sections)} sections")
-                all_sections.extend(sections)
-            except Exception as e:
-                print(f"  -> ERROR: {str(e)}")
+            pdf_paths[document['filename']] = pdf_path
         else:
-            print(f"  -> ERROR: File not found: {pdf_path}")
+            log.info(f"\nProcessing: {document['title']}")
+            log.error(f"  -> ERROR: File not found: {pdf_path}")
+    
+    # PDF parsing is CPU-bound - extract documents in parallel worker processes
+    extracted = {}
+    if pdf_paths:
+        max_workers = min(os.cpu_count() or 1, len(pdf_paths), 8)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(extract_sections, pdf_path, document_name=filename, workers=1): filename
+                for filename, pdf_path in pdf_paths.items()
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    extracted[filename] = future.result()
+                except Exception as e:
+                    log.error(f"  -> ERROR ({filename}): {str(e)}")
+    
+    # Collect in input order so ranking stays deterministic
+    for document in input_data['documents']:
+        if document['filename'] not in extracted:
+            continue
+        log.info(f"\nProcessing: {document['title']}")
+        sections = extracted[document['filename']]
+        log.info(f"  -> Extracted {len(sections)} sections")
+        all_sections.extend(sections)
+        total_chars += sum(len(section.get('section_text', '')) for section in sections)
     
     extraction_time = time.time() - start_time
-    print(f"\nExtraction complete:")
-    print(f"  Total sections: {len(all_sections)}")
-    print(f"  Processing time: {extraction_time:.2f} seconds")
+    log.info(f"\nExtraction complete:")
+    log.info(f"  Total sections: {len(all_sections)}")
+    log.info(f"  Processing time: {extraction_time:.2f} seconds")
     
     if not all_sections:
-        print("ERROR: No sections extracted - cannot proceed with ranking")
+        log.error("ERROR: No sections extracted - cannot proceed with ranking")
         return False
     
     # Run BERT ranking
-    print("\nRunning BERT ranking...")
+    log.info("\nRunning BERT ranking...")
     ranking_start = time.time()
     
     # Use persona and job description for ranking
     persona = input_data['persona']['role']
     job_description = input_data['job_to_be_done']['task']
     
-    ranked_results, subsection_analysis = rank_sections(all_sections, persona, job_description)
+    # Query embedding is cached per persona/job, so repeat collections skip it.
+    # A failure here fails this collection only, not the whole --all run.
+    try:
+        query_embedding = encode_query(persona, job_description)
+    except Exception as e:
+        log.error(f"ERROR: Could not embed the persona/job query: {e}")
+        return False
+    ranked_results, subsection_analysis = rank_sections(
+        all_sections, persona, job_description, query_embedding=query_embedding,
+        tokenizer=tokenizer, model=model
+    )
     
     ranking_time = time.time() - ranking_start
-    print(f"⏱️  BERT ranking time: {ranking_time:.2f} seconds")
-    print(f"🚀 Processing speed: {len(all_sections)/ranking_time:.1f} sections/second")
+    log.info(f"⏱️  BERT ranking time: {ranking_time:.2f} seconds")
+    log.info(f"🚀 Processing speed: {len(all_sections)/ranking_time:.1f} sections/second")
     
     # Create output JSON file
     if args and args.docker:
@@ -110,7 +150,7 @@ def process_collection(collection_path, args=None):
         'input_documents': [d['filename'] for d in input_data['documents']],
         'persona': persona,
         'job_to_be_done': job_description,
-        'processing_timestamp': datetime.datetime.now().isoformat(),
+        'processing_timestamp': timestamp or datetime.datetime.now(datetime.timezone.utc).isoformat(),
         'model_type': 'BERT (RoBERTa-Base)',
         'processing_time_seconds': ranking_time + extraction_time,
         'sections_processed': len(all_sections),
@@ -125,48 +165,73 @@ def process_collection(collection_path, args=None):
     
     # Write output JSON
     try:
-        with open(output_json, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
-        print(f"\n💾 Output written to: {output_json}")
-        print(f"📝 Total ranked sections: {len(ranked_results)}")
+        with open(output_json, 'wb') as f:
+            f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2))
+        log.info(f"\n💾 Output written to: {output_json}")
+        log.info(f"📝 Total ranked sections: {len(ranked_results)}")
     except Exception as e:
-        print(f"⚠️  Warning: Could not write output file: {e}")
+        log.warning(f"⚠️  Warning: Could not write output file: {e}")
     
-    # Display top results
-    print("\n🏆 TOP 10 BERT RANKED RESULTS:")
-    print("=" * 80)
+    # Display top results (cosmetic - skipped when output is not a terminal)
+    display = (sys.stdout.isatty()
+               and not getattr(args, 'quiet', False)
+               and not getattr(args, 'no_display', False))
     
-    for i, section in enumerate(ranked_results[:10], 1):
-        title = section.get('section_title', 'Untitled')
-        text = section.get('section_text', '')
+    # Full content dump only at --verbose
+    if display and log.isEnabledFor(logging.DEBUG):
+        log.debug("\n🏆 TOP 10 BERT RANKED RESULTS:")
+        log.debug("=" * 80)
+    
+        for i, section in enumerate(ranked_results[:10], 1):
+            title = section.get('section_title', 'Untitled')
+            text = section.get('section_text', '')
         
-        print(f"\n{i}. TITLE: {title}")
-        print(f"   SOURCE: {section.get('document', section.get('source', 'Unknown'))}")
-        print(f"   CONTENT: {text[:200]}...")
-        if len(text) > 200:
-            print("   [Content truncated for display]")
+            log.debug(f"\n{i}. TITLE: {title}")
+            log.debug(f"   SOURCE: {section.get('document', section.get('source', 'Unknown'))}")
+            log.debug(f"   CONTENT: {text[:200]}...")
+            if len(text) > 200:
+                log.debug("   [Content truncated for display]")
     
     # Print top 3 sections for verification (like original)
-    print(f"\n📋 TOP 3 SECTIONS SUMMARY:")
-    for i, section in enumerate(ranked_results[:3], 1):
-        document = section.get('document', 'Unknown')
-        title = section.get('section_title', 'Untitled')
-        page = section.get('page_number', 'N/A')
-        print(f"{i}. [{document}] {title} (Page {page})")
+    if display:
+        log.info(f"\n📋 TOP 3 SECTIONS SUMMARY:")
+        for i, section in enumerate(ranked_results[:3], 1):
+            document = section.get('document', 'Unknown')
+            title = section.get('section_title', 'Untitled')
+            page = section.get('page_number', 'N/A')
+            log.info(f"{i}. [{document}] {title} (Page {page})")
     
     # Summary statistics
     total_time = time.time() - start_time
-    print(f"\n📈 PERFORMANCE SUMMARY:")
-    print(f"   Collection: {collection_name}")
-    print(f"   Total Processing Time: {total_time:.2f} seconds")
-    print(f"   Documents Processed: {len(input_data['documents'])}")
-    print(f"   Sections Extracted: {len(all_sections)}")
-    print(f"   Average Section Length: {sum(len(s.get('section_text', '')) for s in all_sections) / len(all_sections):.0f} chars")
-    print(f"   BERT Model: RoBERTa-Base")
-    
-    print(f"\n🎉 BERT processing on {collection_name} complete!")
+    log.info(f"\n📈 PERFORMANCE SUMMARY:")
+    log.info(f"   Collection: {collection_name}")
+    log.info(f"   Total Processing Time: {total_time:.2f} seconds")
+    log.info(f"   Documents Processed: {len(input_data['documents'])}")
+    log.info(f"   Sections Extracted: {len(all_sections)}")
+    log.info(f"   Average Section Length: {total_chars / len(all_sections):.0f} chars")
+    log.info(f"   BERT Model: RoBERTa-Base")
+    
+    log.info(f"\n🎉 BERT processing on {collection_name} complete!")
     return True
 
+def init_collection_worker(num_threads, log_level):
+    """
+    Limit torch threads in a collection worker so parallel BERT models
+    don't oversubscribe the CPU, and apply the parent's log level.
+    """
+    # Read by load_bert_model when this worker loads its model
+    os.environ["RANKER_THREADS"] = str(num_threads)
+    logging.getLogger().setLevel(log_level)
+
+def run_collection_worker(collection_path, args, tokenizer=None, model=None, timestamp=None):
+    """
+    Process one collection between separator lines (pool entry point).
+    """
+    log.info(f"\n{'='*80}")
+    success = process_collection(collection_path, args, tokenizer=tokenizer, model=model, timestamp=timestamp)
+    log.info(f"{'='*80}")
+    return success
+
 def main():
     """
     Main function to process Challenge 1B collections with BERT.
@@ -175,20 +240,31 @@ def main():
     parser.add_argument('--collection', type=str, help='Specific collection to process (1, 2, 3, etc.)')
     parser.add_argument('--all', action='store_true', help='Process all available collections')
     parser.add_argument('--docker', action='store_true', help='Running in Docker environment')
+    parser.add_argument('--quiet', action='store_true', help='Only log warnings and errors')
+    parser.add_argument('--verbose', action='store_true', help='Also log the full top-10 content dump')
+    parser.add_argument('--no-display', action='store_true', help='Skip the top-ranked result listings')
     
     args = parser.parse_args()
     
+    # One timestamp for the whole run keeps collection metadata consistent
+    run_timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    elif args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    
     # Determine base directory (Docker vs local)
     if args.docker or os.path.exists('/app/collections'):
         # Docker environment
         base_dir = '/app/collections'
         output_base = '/app/output'
-        print("🐳 Running in Docker environment")
+        log.info("🐳 Running in Docker environment")
     else:
         # Local environment
         base_dir = os.path.dirname(__file__)
         output_base = base_dir
-        print("💻 Running in local environment")
+        log.info("💻 Running in local environment")
     
     collections = []
     
@@ -197,37 +273,53 @@ def main():
         if os.path.exists(collection_path):
             collections.append(collection_path)
         else:
-            print(f"❌ Collection {args.collection} not found")
+            log.error(f"❌ Collection {args.collection} not found")
             return
     elif args.all:
-        # Find all available collections
-        for item in os.listdir(base_dir):
-            if item.startswith('Collection ') and os.path.isdir(os.path.join(base_dir, item)):
-                collections.append(os.path.join(base_dir, item))
-        collections.sort()  # Sort to process in order
+        # Find all available collections (DirEntry.is_dir avoids an extra stat)
+        with os.scandir(base_dir) as entries:
+            collections = sorted(
+                entry.path for entry in entries
+                if entry.name.startswith('Collection ') and entry.is_dir(follow_symlinks=False)
+            )
     else:
         # Default: process Collection 1
         collection_path = os.path.join(base_dir, 'Collection 1')
         if os.path.exists(collection_path):
             collections.append(collection_path)
         else:
-            print("❌ No Collection 1 found. Use --collection <number> or --all")
+            log.error("❌ No Collection 1 found. Use --collection <number> or --all")
             return
     
     if not collections:
-        print("❌ No collections found to process")
+        log.error("❌ No collections found to process")
         return
     
-    print(f"🚀 Challenge 1B BERT: Processing {len(collections)} collection(s)...")
+    log.info(f"🚀 Challenge 1B BERT: Processing {len(collections)} collection(s)...")
+    log.info(f"🕒 Run timestamp: {run_timestamp}")
+    
+    # BERT is loaded lazily, after extraction: process_collection forks its
+    # extraction pool, and forking after torch has run (OpenMP thread pools,
+    # CUDA) can hang or fail in the child
+    if len(collections) == 1:
+        results = [run_collection_worker(collections[0], args, timestamp=run_timestamp)]
+    else:
+        # One spawned worker per collection, splitting cores between them;
+        # each worker loads its own model
+        max_workers = min(len(collections), max(1, (os.cpu_count() or 2) // 2))
+        num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_collection_worker,
+            initargs=(num_threads, logging.getLogger().level)
+        ) as executor:
+            worker = partial(run_collection_worker, args=args, timestamp=run_timestamp)
+            results = list(executor.map(worker, collections))
     
-    success_count = 0
-    for collection_path in collections:
-        print(f"\n{'='*80}")
-        if process_collection(collection_path, args):
-            success_count += 1
-        print(f"{'='*80}")
+    success_count = sum(1 for success in results if success)
     
-    print(f"\n🏆 Challenge 1B completed! Successfully processed {success_count}/{len(collections)} collections.")
+    log.info(f"\n🏆 Challenge 1B completed! Successfully processed {success_count}/{len(collections)} collections.")
 
 if __name__ == "__main__":
     main()
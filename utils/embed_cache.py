@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import sqlite3
+
+import numpy as np
+
+log = logging.getLogger('challenge1b.embed_cache')
+
+# Cache location (set EMBED_CACHE_DIR="" to disable caching)
+CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", ".embed_cache")
+
+# One connection per (process, model) - sqlite connections must not cross fork()
+_connections = {}
+
+# In-process layer in front of sqlite, so texts seen earlier in this process
+# skip the database (still used when the disk cache is disabled)
+MEMORY_CACHE_SIZE = 20000
+_memory = {}
+
+
+def make_key(model_name, text):
+    """
+    Build the cache key for a text embedded with a given model.
+    """
+    return hashlib.sha256((model_name + "\x00" + text).encode("utf-8")).hexdigest()
+
+
+def _connect(model_name):
+    """
+    Open (or reuse) the sqlite store for a model.
+    """
+    if not CACHE_DIR:
+        return None
+
+    conn_key = (os.getpid(), model_name)
+    conn = _connections.get(conn_key)
+    if conn is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        db_path = os.path.join(CACHE_DIR, f"{model_name.replace('/', '_')}.sqlite")
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+        _connections[conn_key] = conn
+    return conn
+
+
+def get_many(model_name, keys, dtype=np.float16):
+    """
+    Look up several embeddings at once.
+
+    Args:
+        model_name: Model the embeddings were produced with
+        keys: Cache keys from make_key
+        dtype: dtype the vectors were stored with (see put_many)
+
+    Returns:
+        dict: key -> vector for every key found in the cache
+    """
+    found = {key: _memory[key] for key in keys if key in _memory}
+    try:
+        conn = _connect(model_name)
+        if conn is None:
+            return found
+        unique_keys = [key for key in dict.fromkeys(keys) if key not in found]
+        # Stay below sqlite's bound-parameter limit
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i+500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", chunk
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=dtype)
+                _remember(key, found[key])
+    except sqlite3.Error as e:
+        log.warning("Embedding cache read failed: %s", e)
+    return found
+
+
+def put_many(model_name, items, dtype=np.float16):
+    """
+    Store several embeddings at once (as raw bytes of the given dtype).
+
+    Args:
+        model_name: Model the embeddings were produced with
+        items: dict of key -> vector
+        dtype: Storage dtype; a store must always be read with the dtype
+            it was written with, so keep one dtype per model_name
+    """
+    items = {key: np.asarray(vec, dtype=dtype) for key, vec in items.items()}
+    for key, vec in items.items():
+        _remember(key, vec)
+    
+    try:
+        conn = _connect(model_name)
+        if conn is None:
+            return
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(key, vec.tobytes()) for key, vec in items.items()],
+            )
+    except sqlite3.Error as e:
+        log.warning("Embedding cache write failed: %s", e)
+
+
+def _remember(key, vec):
+    """
+    Add an embedding to the in-process layer, dropping the oldest entries
+    once it is full.
+    """
+    _memory[key] = vec
+    while len(_memory) > MEMORY_CACHE_SIZE:
+        del _memory[next(iter(_memory))]
+
+
+def get(model_name, key):
+    """
+    Look up a single embedding, returning None on a cache miss.
+    """
+    return get_many(model_name, [key]).get(key)
+
+
+def put(model_name, key, vec):
+    """
+    Store a single embedding.
+    """
+    put_many(model_name, {key: vec})
@@ -1,345 +1,529 @@
 import PyPDF2
+import logging
+import mmap
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from pathlib import Path
 import json
 
+try:
+    import pymupdf  # PyMuPDF - much faster text extraction than PyPDF2
+except ImportError:
+    try:
+        import fitz as pymupdf  # Older PyMuPDF releases
+    except ImportError:
+        pymupdf = None
+
+try:
+    import re2  # google-re2 - linear-time matching, no backtracking (optional)
+except ImportError:
+    re2 = None
+
+# Precompiled patterns (compiled once at import instead of per call)
+
+log = logging.getLogger('challenge1b.extractor')
+
+# Section type labels (interned: every section dict shares one string object)
+SECTION_HEADING = sys.intern("heading_based")
+SECTION_RECIPE_COMPONENT = sys.intern("recipe_component")
+SECTION_COMPLETE_RECIPE = sys.intern("complete_recipe")
+SECTION_PROCEDURAL = sys.intern("procedural")
+SECTION_CONTENT_BLOCK = sys.intern("content_block")
+SECTION_INDIVIDUAL_RECIPE = sys.intern("individual_recipe")
+
+# Text normalization
+_CAMEL_RE = re.compile(r'([a-z])([A-Z])')  # Space between camelCase
+_NUM_ALPHA_RE = re.compile(r'(\d+)([A-Za-z])')  # Space between numbers and letters
+_ALPHA_NUM_RE = re.compile(r'([a-zA-Z])(\d+)')  # Space between letters and numbers
+_DIGIT_RE = re.compile(r'\d')
+_DOTS_RE = re.compile(r'\s*\.+\s*')  # Dot runs -> single period + space/newline
+
+_LINE_RE = re.compile(r'[^\n]+')
+
+# Enhanced heading patterns for BERT, as one multiline alternation so a page
+# is scanned once. Each alternative names its title group; alternatives are
+# tried in order. Runs on normalize_text output, where lines are stripped
+# and the only whitespace inside a line is a single space.
+_HEADING_RE = re.compile(
+    r'(?m)^(?:'
+    r'(?P<caps>[A-Z][A-Z &]{3,}):? *'  # ALL CAPS headings
+    r'|(?P<numbered>\d+\.?\d* +[A-Z][A-Za-z ]{3,}):? *'  # Numbered headings
+    r'|(?P<title>[A-Z][a-z]+(?: +[A-Z][a-z]+)*):? *'  # Title Case headings
+    r'|(?P<step>Step +\d+[:\-]? *[A-Z][A-Za-z ]+)'  # Step headings
+    r'|(?P<recipe>Recipe[:\-]? *[A-Z][A-Za-z ]+)'  # Recipe headings
+    r')$'
+)
+
+# Recipe indicators
+# (content runs to the end of the line: the greedy [^\n]+ always stops at a
+# line end, so a lazy "until the next keyword" lookahead could never apply)
+_RECIPE_COMPONENT_RES = [
+    re.compile(r'(?i)(ingredients?)\s*:?\s*([^\n]+)'),
+    re.compile(r'(?i)(instructions?|directions?|method|preparation)\s*:?\s*([^\n]+)'),
+    re.compile(r'(?i)(serves?|serving|portions?)\s*:?\s*([^\n]+)'),
+    re.compile(r'(?i)(cooking\s+time|prep\s+time|total\s+time)\s*:?\s*([^\n]+)'),
+]
+_RECIPE_COMPONENT_KEYWORDS = [
+    ('ingredient',),
+    ('instruction', 'direction', 'method', 'preparation'),
+    ('serv', 'portion'),
+    ('time',),
+]
+_RECIPE_BLOCK_RE = re.compile(r'(?i)([A-Z][A-Za-z\s]+(?:recipe|dish|meal))\s*:?\s*([\s\S]+?)(?=(?:[A-Z][A-Za-z\s]+(?:recipe|dish|meal))|$)')
+_RECIPE_BLOCK_KEYWORDS = ('recipe', 'dish', 'meal')
+
+# Procedural patterns
+_PROCEDURAL_RES = [
+    re.compile(r'(?i)(step\s+\d+[:\-]?\s*)([^\n]+(?:\n(?!\s*step\s+\d+)[^\n]+)*)'),
+    re.compile(r'(?i)(\d+\.\s*)([^\n]+(?:\n(?!\s*\d+\.)[^\n]+)*)'),
+    re.compile(r'(?i)(first|second|third|finally|next|then)[:\-]?\s*([^\n]+)'),
+]
+_PROCEDURAL_KEYWORDS = [
+    ('step',),
+    ('.',),
+    ('first', 'second', 'third', 'finally', 'next', 'then'),
+]
+
+# Characters re.IGNORECASE folds onto ASCII letters but str.lower() does not
+_CASE_FOLD_EXCEPTIONS = ('\u0130', '\u0131', '\u017f')  # İ ı ſ
+
+_SENTENCE_END_RE = re.compile(r'[.!?]+')
+
+# Pattern to find recipe titles
+_RECIPE_TITLE_RES = [
+    re.compile(r'(?i)^([A-Z][A-Za-z\s]+(?:recipe|dish|meal|soup|salad|pasta|curry|chicken|beef|vegetarian|vegan))\s*$'),
+    re.compile(r'(?i)([A-Z][A-Za-z\s]+)\s*-\s*(?:serves|cooking time|prep time)'),
+    re.compile(r'(?i)(recipe\s+\d+[:\-]?\s*[A-Z][A-Za-z\s]+)'),
+]
+
+# Characters where re2 and re disagree: Unicode whitespace/digits (re2's \s
+# and \d are ASCII-only) and the dotted/dotless I (different case folding)
+_RE2_UNSAFE_RE = re.compile(r'[^\S \t\n\r\f]|[^\D0-9]|[\u0130\u0131]')
+
+
+def _compile_re2(pattern):
+    """
+    Compile a lookaround-free pattern with re2, or return None if re2
+    isn't installed or doesn't support the pattern
+    """
+    if re2 is None:
+        return None
+    try:
+        return re2.compile(pattern.pattern)
+    except Exception:
+        return None
+
+# re2 twins of the recipe title patterns, which backtrack heavily in re
+# (they are free of lookarounds and ^/$ only ever anchor a single line)
+_RE2_PATTERNS = {pattern: _compile_re2(pattern) for pattern in _RECIPE_TITLE_RES}
+
+
+def _select_engine(patterns, text):
+    """
+    Swap in re2's compiled version of each pattern when it is guaranteed to
+    match exactly like re on this text.
+    """
+    if re2 is None or _RE2_UNSAFE_RE.search(text):
+        return patterns
+    return [_RE2_PATTERNS.get(pattern) or pattern for pattern in patterns]
+
+
+def iter_page_texts(pdf_path):
+    """
+    Open a PDF once and yield (page_num, page_text) for each page.
+    Uses PyMuPDF when installed, falling back to PyPDF2.
+    Pages whose text cannot be extracted are reported and skipped.
+    """
+    if pymupdf is not None:
+        with pymupdf.open(pdf_path) as doc:
+            for page_num, page in enumerate(doc, 1):
+                try:
+                    page_text = page.get_text("text")
+                except Exception as e:
+                    log.warning("Error reading page %d: %s", page_num, e)
+                    continue
+                yield page_num, page_text
+        return
+    
+    # Memory-map the file so PyPDF2's many small seeks/reads don't go through
+    # Python file buffers; strict=False skips structural validation
+    with open(pdf_path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as pdf_data:
+        pdf_reader = PyPDF2.PdfReader(pdf_data, strict=False)
+        for page_num, page in enumerate(pdf_reader.pages, 1):
+            try:
+                page_text = page.extract_text()
+            except Exception as e:
+                log.warning("Error reading page %d: %s", page_num, e)
+                continue
+            yield page_num, page_text
+
 
-def extract_sections(pdf_path):
+# Documents with fewer pages than this are parsed in-process (pool startup isn't worth it)
+PARALLEL_PAGE_THRESHOLD = 8
+
+
+def extract_sections(pdf_path, document_name=None, workers=1):
     """
     Extract text sections from PDF document.
     Optimized for BERT-based semantic ranking.
     
     Args:
         pdf_path: Path to PDF file
+        document_name: Name stored in each section's "document" field
+            (defaults to the PDF file name)
+        workers: Processes used to parse pages (default 1: per-document pool
+            startup costs more than parsing the sample PDFs' 2-30 pages)
         
     Returns:
         list: List of section dictionaries with text and metadata
     """
-    sections = []
+    document_name = sys.intern(document_name or Path(pdf_path).name)
     
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            for page_num, page in enumerate(pdf_reader.pages, 1):
-                try:
-                    page_text = page.extract_text()
-                    if not page_text.strip():
-                        continue
-                    
-                    # Extract sections from this page
-                    page_sections = parse_page_content(page_text, pdf_path, page_num)
-                    sections.extend(page_sections)
-                    
-                except Exception as e:
-                    print(f"Warning: Error processing page {page_num}: {e}")
-                    continue
+        pages = read_pages(pdf_path, document_name)
+        sections = _map_pages(_parse_page, pages, workers)
     
     except Exception as e:
-        print(f"ERROR: Could not read PDF {pdf_path}: {e}")
+        log.error("Could not read PDF %s: %s", pdf_path, e)
         return []
     
-    print(f"Extracted {len(sections)} sections from {Path(pdf_path).name}")
+    log.info("Extracted %d sections from %s", len(sections), Path(pdf_path).name)
     return sections
 
 
-def parse_page_content(text, pdf_path, page_num):
+def read_pages(pdf_path, document_name):
+    """
+    Read every non-empty page up front (the I/O phase), so parsing can run
+    separately over the collected texts.
+    
+    Returns:
+        list: (page_text, document_name, page_num) tuples
+    """
+    return [
+        (page_text, document_name, page_num)
+        for page_num, page_text in iter_page_texts(pdf_path)
+        if page_text.strip()
+    ]
+
+
+def _map_pages(parse_page, pages, workers=1):
+    """
+    Apply parse_page to each page tuple and collect the sections in page
+    order, across processes when the document is large enough.
+    """
+    sections = []
+    workers = min(workers or 1, len(pages))
+    
+    if workers > 1 and len(pages) >= PARALLEL_PAGE_THRESHOLD:
+        # Pages are independent, so parse them across processes
+        chunksize = max(1, len(pages) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for page_sections in executor.map(parse_page, pages, chunksize=chunksize):
+                sections.extend(page_sections)
+    else:
+        for page in pages:
+            sections.extend(parse_page(page))
+    
+    return sections
+
+
+# Pages with less text than this (covers, blank pages, page numbers) are skipped
+MIN_PAGE_CHARS = 40
+
+
+def _parse_page(page):
+    """
+    Parse one (page_text, document_name, page_num) tuple, reporting errors
+    instead of raising so one bad page doesn't lose the whole document
+    """
+    page_text, document_name, page_num = page
+    try:
+        return list(parse_page_content(page_text, document_name, page_num))
+    except Exception as e:
+        log.warning("Error processing page %d: %s", page_num, e)
+        return []
+
+
+def parse_page_content(text, document_name, page_num):
     """
     Parse page text into meaningful sections for BERT analysis.
     
     Args:
         text: Raw page text
-        pdf_path: Source PDF path  
+        document_name: Source document name
         page_num: Page number
         
-    Returns:
-        list: List of section dictionaries
+    Yields:
+        dict: Section dictionaries, in detection order
     """
-    sections = []
-    
-    # Clean and normalize text
+    # Clean and normalize text (headings need the line breaks, the other
+    # detectors work on the page as a single line)
     cleaned_text = normalize_text(text)
+    if len(cleaned_text) < MIN_PAGE_CHARS:
+        return
+    flat_text = cleaned_text.replace('\n', ' ')
     
     # Multiple section detection strategies
-    sections.extend(detect_heading_sections(cleaned_text, pdf_path, page_num))
-    sections.extend(detect_recipe_sections(cleaned_text, pdf_path, page_num))
-    sections.extend(detect_procedural_sections(cleaned_text, pdf_path, page_num))
+    found = False
+    for section in chain(
+        detect_heading_sections(cleaned_text, document_name, page_num),
+        detect_recipe_sections(flat_text, document_name, page_num),
+        detect_procedural_sections(flat_text, document_name, page_num),
+    ):
+        found = True
+        yield section
     
     # If no structured sections found, create content blocks
-    if not sections:
-        sections = create_content_blocks(cleaned_text, pdf_path, page_num)
-    
-    return sections
+    if not found:
+        yield from create_content_blocks(flat_text, document_name, page_num)
 
 def normalize_text(text):
     """
-    Clean and normalize text for optimal BERT processing
+    Clean and normalize text for optimal BERT processing.
+    Line breaks are kept (collapsed to one per whitespace run) so headings
+    can still be found line by line.
     """
-    # Remove excessive whitespace and normalize
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Fix common PDF extraction issues
-    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)  # Add spaces between camelCase
-    text = re.sub(r'(\d+)([A-Za-z])', r'\1 \2', text)  # Space between numbers and letters
-    text = re.sub(r'([a-zA-Z])(\d+)', r'\1 \2', text)  # Space between letters and numbers
-    
-    # Clean up punctuation
-    text = re.sub(r'\.{2,}', '.', text)  # Multiple dots to single
-    text = re.sub(r'\s*\.\s*', '. ', text)  # Proper spacing around periods
-    
+    # Collapse whitespace with str methods (C speed) instead of a regex scan
+    lines = (' '.join(line.split()) for line in text.split('\n'))
+    text = '\n'.join([line for line in lines if line])
+    
+    text = _CAMEL_RE.sub(r'\1 \2', text)
+    # Cheap prechecks skip the regex scans when there is nothing to fix
+    if _DIGIT_RE.search(text):
+        text = _NUM_ALPHA_RE.sub(r'\1 \2', text)
+        text = _ALPHA_NUM_RE.sub(r'\1 \2', text)
+    if '.' in text:
+        text = _DOTS_RE.sub(_dots_replacement, text)
     return text.strip()
 
-def detect_heading_sections(text, pdf_path, page_num):
+def _dots_replacement(match):
+    """
+    Replacement for one _DOTS_RE match (keeps a line break it swallowed)
+    """
+    return '.\n' if '\n' in match.group() else '. '
+
+def detect_heading_sections(text, document_name, page_num):
     """
     Detect sections based on heading patterns (optimized for BERT)
     """
-    sections = []
-    
-    # Enhanced heading patterns for BERT
-    heading_patterns = [
-        r'^([A-Z][A-Z\s&]{3,}):?\s*$',  # ALL CAPS headings
-        r'^(\d+\.?\d*\s+[A-Z][A-Za-z\s]{3,}):?\s*$',  # Numbered headings
-        r'^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*):?\s*$',  # Title Case headings
-        r'^(Step\s+\d+[:\-]?\s*[A-Z][A-Za-z\s]+)$',  # Step headings
-        r'^(Recipe[:\-]?\s*[A-Z][A-Za-z\s]+)$',  # Recipe headings
-    ]
+    # A section needs a heading line plus at least one content line
+    if '\n' not in text:
+        return
     
-    lines = text.split('\n')
     current_section = None
-    content_buffer = []
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Check if line matches any heading pattern
-        heading_match = None
-        for pattern in heading_patterns:
-            match = re.match(pattern, line)
-            if match:
-                heading_match = match.group(1).strip()
-                break
+    content_start = 0
+    
+    # Content of a section is everything between its heading and the next
+    for match in _HEADING_RE.finditer(text):
+        content = text[content_start:match.start()].strip()
+        if current_section and content:
+            yield {
+                "document": document_name,
+                "section_title": current_section,
+                "section_text": content.replace('\n', ' '),
+                "page_number": page_num,
+                "section_type": SECTION_HEADING
+            }
         
-        if heading_match:
-            # Save previous section if exists
-            if current_section and content_buffer:
-                sections.append({
-                    "document": Path(pdf_path).name,
-                    "section_title": current_section,
-                    "section_text": ' '.join(content_buffer),
-                    "page_number": page_num,
-                    "section_type": "heading_based"
-                })
-            
-            # Start new section
-            current_section = heading_match
-            content_buffer = []
-        else:
-            # Add to content buffer
-            if current_section:
-                content_buffer.append(line)
+        # Start new section
+        current_section = match.group(match.lastgroup).strip()
+        content_start = match.end()
     
     # Add final section
-    if current_section and content_buffer:
-        sections.append({
-            "document": Path(pdf_path).name,
+    content = text[content_start:].strip()
+    if current_section and content:
+        yield {
+            "document": document_name,
             "section_title": current_section,
-            "section_text": ' '.join(content_buffer),
+            "section_text": content.replace('\n', ' '),
             "page_number": page_num,
-            "section_type": "heading_based"
-        })
+            "section_type": SECTION_HEADING
+        }
+
+def _keyword_filter(text):
+    """
+    Return a predicate telling whether any of a pattern's literal keywords
+    occur in the text, so patterns that cannot match are skipped.
+    Substring checks on the lowered text are far cheaper than a regex scan.
+    """
+    if any(c in text for c in _CASE_FOLD_EXCEPTIONS):
+        return lambda keywords: True
     
-    return sections
+    lowered = text.lower()
+    return lambda keywords: any(keyword in lowered for keyword in keywords)
 
-def detect_recipe_sections(text, pdf_path, page_num):
+def detect_recipe_sections(text, document_name, page_num):
     """
     Detect recipe sections with enhanced patterns for BERT
     """
-    sections = []
-    
-    # Recipe indicators
-    recipe_patterns = [
-        r'(?i)(ingredients?)\s*:?\s*([^\n]+(?:\n[^\n]+)*?)(?=instructions?|directions?|method|preparation|\n\s*\n|$)',
-        r'(?i)(instructions?|directions?|method|preparation)\s*:?\s*([^\n]+(?:\n[^\n]+)*?)(?=ingredients?|notes?|\n\s*\n|$)',
-        r'(?i)(serves?|serving|portions?)\s*:?\s*([^\n]+)',
-        r'(?i)(cooking\s+time|prep\s+time|total\s+time)\s*:?\s*([^\n]+)',
-    ]
+    may_match = _keyword_filter(text)
     
     # Find recipe components
-    for pattern in recipe_patterns:
-        matches = re.finditer(pattern, text, re.MULTILINE | re.DOTALL)
+    for pattern, keywords in zip(_RECIPE_COMPONENT_RES, _RECIPE_COMPONENT_KEYWORDS):
+        if not may_match(keywords):
+            continue
+        matches = pattern.finditer(text)
         for match in matches:
             title = match.group(1).strip().title()
             content = match.group(2).strip()
             
             if len(content) > 20:  # Minimum content length
-                sections.append({
-                    "document": Path(pdf_path).name,
+                yield {
+                    "document": document_name,
                     "section_title": title,
                     "section_text": content,
                     "page_number": page_num,
-                    "section_type": "recipe_component"
-                })
+                    "section_type": SECTION_RECIPE_COMPONENT
+                }
     
     # Look for complete recipe blocks
-    recipe_block_pattern = r'(?i)([A-Z][A-Za-z\s]+(?:recipe|dish|meal))\s*:?\s*([\s\S]+?)(?=(?:[A-Z][A-Za-z\s]+(?:recipe|dish|meal))|$)'
-    recipe_matches = re.finditer(recipe_block_pattern, text)
+    if not may_match(_RECIPE_BLOCK_KEYWORDS):
+        return
+    recipe_matches = _RECIPE_BLOCK_RE.finditer(text)
     
     for match in recipe_matches:
         title = match.group(1).strip()
         content = match.group(2).strip()
         
         if len(content) > 100:  # Substantial recipe content
-            sections.append({
-                "document": Path(pdf_path).name,
+            yield {
+                "document": document_name,
                 "section_title": title,
                 "section_text": content[:500],  # Limit for BERT processing
                 "page_number": page_num,
-                "section_type": "complete_recipe"
-            })
-    
-    return sections
+                "section_type": SECTION_COMPLETE_RECIPE
+            }
 
-def detect_procedural_sections(text, pdf_path, page_num):
+def detect_procedural_sections(text, document_name, page_num):
     """
     Detect procedural/instructional sections for BERT processing
     """
-    sections = []
-    
-    # Procedural patterns
-    procedural_patterns = [
-        r'(?i)(step\s+\d+[:\-]?\s*)([^\n]+(?:\n(?!\s*step\s+\d+)[^\n]+)*)',
-        r'(?i)(\d+\.\s*)([^\n]+(?:\n(?!\s*\d+\.)[^\n]+)*)',
-        r'(?i)(first|second|third|finally|next|then)[:\-]?\s*([^\n]+(?:\n[^\n]+)*?)(?=(?:first|second|third|finally|next|then)|\n\s*\n|$)',
-    ]
+    may_match = _keyword_filter(text)
     
-    for pattern in procedural_patterns:
-        matches = re.finditer(pattern, text, re.MULTILINE | re.DOTALL)
+    for pattern, keywords in zip(_PROCEDURAL_RES, _PROCEDURAL_KEYWORDS):
+        if not may_match(keywords):
+            continue
+        matches = pattern.finditer(text)
         for match in matches:
             title = match.group(1).strip()
             content = match.group(2).strip()
             
             if len(content) > 30:  # Minimum content length
-                sections.append({
-                    "document": Path(pdf_path).name,
+                yield {
+                    "document": document_name,
                     "section_title": f"Procedure: {title}",
                     "section_text": content,
                     "page_number": page_num,
-                    "section_type": "procedural"
-                })
-    
-    return sections
+                    "section_type": SECTION_PROCEDURAL
+                }
 
-def create_content_blocks(text, pdf_path, page_num):
+def _iter_sentences(text):
     """
-    Create content blocks when no structured sections are found
+    Yield the non-empty, stripped sentences of a text one at a time
+    (same pieces as re.split on sentence terminators, without the list)
     """
-    sections = []
-    
-    # Split text into meaningful chunks (optimal for BERT)
-    sentences = re.split(r'[.!?]+', text)
-    
-    current_block = []
-    block_count = 1
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        sentence = text[start:match.start()].strip()
+        start = match.end()
+        if sentence:
+            yield sentence
+    
+    sentence = text[start:].strip()
+    if sentence:
+        yield sentence
+
+# Target content block size for BERT (150-300 words)
+BLOCK_TARGET_WORDS = 150
+
+def _pack_blocks(sentences, target_words=BLOCK_TARGET_WORDS):
+    """
+    Group consecutive sentences into blocks of at least target_words words
+    (the last block may be shorter). Yields each block as a list of sentences.
+    """
+    block = []
+    block_words = 0  # Running word count, so the block isn't re-joined per sentence
     
     for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
+        block.append(sentence)
+        block_words += len(sentence.split())
         
-        current_block.append(sentence)
-        
-        # Create blocks of optimal size for BERT (150-300 words)
-        if len(' '.join(current_block).split()) >= 150:
-            block_text = '. '.join(current_block) + '.'
-            
-            # Create a meaningful title from first sentence
-            title = current_block[0][:50] + "..." if len(current_block[0]) > 50 else current_block[0]
-            
-            sections.append({
-                "document": Path(pdf_path).name,
-                "section_title": f"Content Block {block_count}: {title}",
-                "section_text": block_text,
-                "page_number": page_num,
-                "section_type": "content_block"
-            })
-            
-            current_block = []
-            block_count += 1
+        if block_words >= target_words:
+            yield block
+            block = []
+            block_words = 0
     
-    # Add remaining content
-    if current_block:
-        block_text = '. '.join(current_block) + '.'
-        title = current_block[0][:50] + "..." if len(current_block[0]) > 50 else current_block[0]
+    if block:
+        yield block
+
+def create_content_blocks(text, document_name, page_num):
+    """
+    Create content blocks when no structured sections are found
+    """
+    # Split text into meaningful chunks (optimal for BERT)
+    for block_count, block in enumerate(_pack_blocks(_iter_sentences(text)), 1):
+        block_text = '. '.join(block) + '.'
+        
+        # Create a meaningful title from first sentence
+        title = block[0][:50] + "..." if len(block[0]) > 50 else block[0]
         
-        sections.append({
-            "document": Path(pdf_path).name,
+        yield {
+            "document": document_name,
             "section_title": f"Content Block {block_count}: {title}",
             "section_text": block_text,
             "page_number": page_num,
-            "section_type": "content_block"
-        })
-    
-    return sections
+            "section_type": SECTION_CONTENT_BLOCK
+        }
 
-def extract_recipe_sections(pdf_path):
+def extract_recipe_sections(pdf_path, document_name=None, workers=1):
     """
     Specialized recipe extraction for food-related documents
     """
-    sections = []
+    document_name = sys.intern(document_name or Path(pdf_path).name)
     
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            
-            for page_num, page in enumerate(reader.pages, 1):
-                try:
-                    text = page.extract_text()
-                    if not text.strip():
-                        continue
-                    
-                    # Enhanced recipe detection
-                    recipe_sections = detect_individual_recipes(text, pdf_path, page_num)
-                    sections.extend(recipe_sections)
-                    
-                except Exception as e:
-                    print(f"⚠️  Error processing recipes on page {page_num}: {e}")
-                    continue
+        pages = read_pages(pdf_path, document_name)
+        sections = _map_pages(_parse_recipe_page, pages, workers)
     
     except Exception as e:
-        print(f"❌ Error reading PDF for recipes {pdf_path}: {e}")
+        log.error("Error reading PDF for recipes %s: %s", pdf_path, e)
         return []
     
-    print(f"🍳 Extracted {len(sections)} recipe sections from {Path(pdf_path).name}")
+    log.info("🍳 Extracted %d recipe sections from %s", len(sections), document_name)
     return sections
 
-def detect_individual_recipes(text, pdf_path, page_num):
+def _parse_recipe_page(page):
+    """
+    Enhanced recipe detection for one (page_text, document_name, page_num)
+    tuple, reporting errors instead of raising
+    """
+    text, document_name, page_num = page
+    try:
+        return list(detect_individual_recipes(text, document_name, page_num))
+    except Exception as e:
+        log.warning("Error processing recipes on page %d: %s", page_num, e)
+        return []
+
+def detect_individual_recipes(text, document_name, page_num):
     """
     Detect individual recipes with complete ingredient lists and instructions
     """
-    sections = []
-    
-    # Pattern to find recipe titles
-    recipe_title_patterns = [
-        r'(?i)^([A-Z][A-Za-z\s]+(?:recipe|dish|meal|soup|salad|pasta|curry|chicken|beef|vegetarian|vegan))\s*$',
-        r'(?i)([A-Z][A-Za-z\s]+)\s*-\s*(?:serves|cooking time|prep time)',
-        r'(?i)(recipe\s+\d+[:\-]?\s*[A-Z][A-Za-z\s]+)',
-    ]
-    
-    lines = text.split('\n')
     current_recipe = None
     recipe_content = []
+    title_patterns = _select_engine(_RECIPE_TITLE_RES, text)
     
-    for line in lines:
-        line = line.strip()
+    for line_match in _LINE_RE.finditer(text):
+        line = line_match.group().strip()
         if not line:
             continue
         
         # Check for recipe title
         title_match = None
-        for pattern in recipe_title_patterns:
-            match = re.search(pattern, line)
+        for pattern in title_patterns:
+            match = pattern.search(line)
             if match:
                 title_match = match.group(1).strip()
                 break
@@ -349,13 +533,13 @@ def detect_individual_recipes(text, pdf_path, page_num):
             if current_recipe and recipe_content:
                 recipe_text = ' '.join(recipe_content)
                 if len(recipe_text) > 50:  # Ensure substantial content
-                    sections.append({
-                        "document": Path(pdf_path).name,
+                    yield {
+                        "document": document_name,
                         "section_title": current_recipe,
                         "section_text": recipe_text,
                         "page_number": page_num,
-                        "section_type": "individual_recipe"
-                    })
+                        "section_type": SECTION_INDIVIDUAL_RECIPE
+                    }
             
             # Start new recipe
             current_recipe = title_match
@@ -369,15 +553,13 @@ def detect_individual_recipes(text, pdf_path, page_num):
     if current_recipe and recipe_content:
         recipe_text = ' '.join(recipe_content)
         if len(recipe_text) > 50:
-            sections.append({
-                "document": Path(pdf_path).name,
+            yield {
+                "document": document_name,
                 "section_title": current_recipe,
                 "section_text": recipe_text,
                 "page_number": page_num,
-                "section_type": "individual_recipe"
-            })
-    
-    return sections
+                "section_type": SECTION_INDIVIDUAL_RECIPE
+            }
 
 # Test function
 def test_extraction():
@@ -409,4 +591,5 @@ def test_extraction():
         print()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     test_extraction()
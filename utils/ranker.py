@@ -1,14 +1,138 @@
 import torch
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import logging
+import os
 import time
 import re
+from itertools import islice
 from pathlib import Path
 
+import embed_cache
+
+log = logging.getLogger('challenge1b.ranker')
+
+MODEL_NAME = "roberta-base"
+
+# Storage dtype for embeddings (RANKER_DTYPE=fp32 keeps full precision).
+# Similarities are always computed in float32.
+STORAGE_DTYPE = "fp32" if os.environ.get("RANKER_DTYPE", "fp16") == "fp32" else "fp16"
+EMBEDDING_DTYPE = np.float32 if STORAGE_DTYPE == "fp32" else np.float16
+
+# Inference precision: "bf16", "int8" (dynamic quantization) or "fp32".
+# "auto" picks bf16 on CPUs with native bfloat16 support, int8 elsewhere.
+PRECISION = os.environ.get("RANKER_PRECISION", "auto")
+
+# Inference backend: "torch" or "onnx" (ONNX Runtime on an INT8 export of the
+# model, created in ONNX_DIR on first use; falls back to torch if unavailable)
+BACKEND = os.environ.get("RANKER_BACKEND", "torch")
+ONNX_DIR = os.environ.get("RANKER_ONNX_DIR", ".onnx_model")
+ONNX_OPSET = 17
+
+# Two-stage ranking: when set, an early-exit pass through the first
+# SHALLOW_LAYERS layers scores every candidate and only the top RERANK_K
+# go through the full model (0 disables; torch backend only)
+RERANK_K = int(os.environ.get("RANKER_RERANK_K", "0"))
+SHALLOW_LAYERS = 4
+
+# ONNX INT8 scheme: "dynamic" quantizes weights only (recommended for
+# transformers); "static" also quantizes activations, with ranges calibrated
+# on CALIBRATION_TEXTS - opt-in until its rankings are checked against fp32
+ONNX_QUANTIZATION = os.environ.get("RANKER_ONNX_QUANT", "dynamic")
+ONNX_VARIANT = "int8-static" if ONNX_QUANTIZATION == "static" else "int8"
+
+# Representative section texts for activation range calibration
+CALIBRATION_TEXTS = [
+    "Vegetarian Lasagna Ingredients: 12 lasagna noodles, 2 cups ricotta cheese, 1 cup spinach, 3 cups marinara sauce",
+    "Instructions: Preheat the oven to 375°F. Layer the noodles, cheese and sauce, then bake for 45 minutes.",
+    "Falafel. Soak the chickpeas overnight, blend with herbs and spices, shape into balls and fry until golden.",
+    "Coastal Adventures: The South of France offers beaches, water sports and scenic coastal hikes for groups of friends.",
+    "Nightlife and Entertainment: Nice and Marseille have bars, clubs and live music venues open late into the night.",
+    "Packing tips: bring layers for cool evenings, comfortable walking shoes, travel adapters and a reusable water bottle.",
+    "To create a fillable form, choose Tools > Prepare Form, select the document and Acrobat detects the form fields.",
+    "Request e-signatures by sending the PDF to recipients; you can track the status of each agreement in the dashboard.",
+    "Onboarding checklist for new employees: complete compliance forms, set up accounts and schedule orientation sessions.",
+    "Corporate Event Planning Guide: venue selection, catering options and scheduling considerations for business events.",
+    "Gluten-free options include quinoa salad, roasted vegetables and rice noodles served with a sesame ginger dressing.",
+    "Chapter 3 Results. Table 2 summarizes the quarterly revenue growth of 12% across all regions compared with 2022.",
+]
+
 # Model globals to avoid reloading
 _tokenizer = None
 _model = None
 _model_loaded = False
+_precision = None  # Precision actually in use, set by load_bert_model
+
+# Inputs are cut to this many characters before tokenization
+# (RoBERTa's 512 tokens at ~4 characters per token)
+MAX_INPUT_CHARS = 2048
+
+# RoBERTa's separator token, placed between section title and text
+TITLE_SEPARATOR = "</s>"
+
+# Query embeddings keyed by (persona, job_description)
+_query_cache = {}
+
+# Comprehensive synonym mapping
+_SYNONYM_MAP = {
+    # Food & Cooking
+    'food': ['recipe', 'dish', 'meal', 'cuisine', 'cooking', 'culinary'],
+    'recipe': ['dish', 'meal', 'food', 'cooking', 'preparation'],
+    'vegetarian': ['plant-based', 'vegan', 'meatless', 'veggie'],
+    'cooking': ['preparation', 'culinary', 'recipe', 'kitchen'],
+    'menu': ['dishes', 'options', 'selection', 'offerings'],
+    'buffet': ['self-service', 'spread', 'selection'],
+    
+    # Travel & Tourism
+    'travel': ['trip', 'journey', 'vacation', 'tourism', 'visit'],
+    'trip': ['journey', 'travel', 'vacation', 'excursion'],
+    'vacation': ['holiday', 'trip', 'travel', 'getaway'],
+    'itinerary': ['schedule', 'plan', 'agenda', 'program'],
+    'tourist': ['visitor', 'traveler', 'sightseer'],
+    'cultural': ['heritage', 'historical', 'traditional'],
+    
+    # Business & Corporate
+    'corporate': ['business', 'company', 'office', 'professional'],
+    'business': ['corporate', 'company', 'commercial', 'professional'],
+    'gathering': ['meeting', 'event', 'function', 'assembly'],
+    'professional': ['business', 'corporate', 'work'],
+    
+    # Documents & Management
+    'document': ['file', 'pdf', 'form', 'paper', 'report'],
+    'management': ['administration', 'organization', 'coordination'],
+    'plan': ['organize', 'schedule', 'arrange', 'design', 'prepare'],
+    'create': ['make', 'build', 'generate', 'produce', 'develop'],
+    'prepare': ['make', 'create', 'organize', 'arrange'],
+    
+    # Actions & Processes
+    'organize': ['arrange', 'plan', 'coordinate', 'manage'],
+    'arrange': ['organize', 'plan', 'set up', 'coordinate'],
+    'schedule': ['plan', 'organize', 'arrange', 'time'],
+    'coordinate': ['organize', 'manage', 'arrange'],
+}
+
+# Top 3 synonyms per keyword (more would bloat the query), as insertion-ready dicts
+_TOP_SYNONYMS = {
+    keyword: dict.fromkeys(synonyms[:3]) for keyword, synonyms in _SYNONYM_MAP.items()
+}
+
+# ASCII bytes that are neither letters nor whitespace, and non-ASCII
+# whitespace, for letter_space_count
+_NON_LETTER_SPACE_BYTES = bytes(b for b in range(128) if not re.match(r'[a-zA-Z\s]', chr(b)))
+_UNICODE_SPACE_RE = re.compile(r'[^\S\x00-\x7f]')
+
+# Persona keyword extraction
+_WORD_RE = re.compile(r'\b[a-zA-Z]{3,}\b')
+
+# Common stopwords to filter out
+_STOPWORDS = frozenset({
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'can', 'had', 
+    'her', 'was', 'one', 'our', 'out', 'day', 'get', 'has', 'him', 'how', 
+    'man', 'new', 'now', 'old', 'see', 'two', 'way', 'who', 'with', 'that',
+    'this', 'will', 'any', 'may', 'say', 'she', 'use', 'each', 'which',
+    'their', 'time', 'work', 'first', 'been', 'call', 'find', 'long',
+    'down', 'right', 'look', 'only', 'come', 'over', 'think', 'also',
+    'back', 'after', 'very', 'good', 'well', 'where', 'much', 'before'
+})
 
 
 def load_bert_model():
@@ -16,7 +140,7 @@ def load_bert_model():
     Initialize RoBERTa model for document ranking.
     Uses caching to avoid reloading on subsequent calls.
     """
-    global _tokenizer, _model, _model_loaded
+    global _tokenizer, _model, _model_loaded, _precision
     
     if _model_loaded:
         return _tokenizer, _model
@@ -24,38 +148,235 @@ def load_bert_model():
     try:
         from transformers import AutoTokenizer, AutoModel
         
-        print("Loading BERT model...")
-        print("  Model: RoBERTa-Base (125M parameters, ~500MB)")
-        print("  Features: Multi-layer embeddings, quantization")
-        print("  Size constraint: <1GB (compliant)")
+        log.info("Loading BERT model...")
+        log.debug("  Model: RoBERTa-Base (125M parameters, ~500MB)")
+        log.debug("  Features: Multi-layer embeddings, quantization")
+        log.debug("  Size constraint: <1GB (compliant)")
         
-        model_name = "roberta-base"
+        pin_threads()
         
         # Load pretrained model and tokenizer
-        _tokenizer = AutoTokenizer.from_pretrained(model_name)
-        _model = AutoModel.from_pretrained(model_name)
+        _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+        
+        if BACKEND == "onnx":
+            try:
+                _model = OnnxEncoder(export_onnx())
+                _precision = f"onnx-{ONNX_VARIANT}"
+                warm_up(_tokenizer, _model)
+                _model_loaded = True
+                log.info("BERT model ready! (ONNX Runtime, %s INT8)", ONNX_QUANTIZATION)
+                return _tokenizer, _model
+            except Exception as e:
+                log.warning("ONNX Runtime unavailable, using torch: %s", e)
         
-        # Apply INT8 quantization for speed
         try:
-            print("  Applying quantization...")
-            _model = torch.quantization.quantize_dynamic(
-                _model, {torch.nn.Linear}, dtype=torch.qint8
-            )
-            print("  Quantization successful (2-3x speedup)")
-        except Exception as e:
-            print(f"  Quantization failed, using full precision: {e}")
-        
+            # Fused scaled_dot_product_attention kernels
+            _model = AutoModel.from_pretrained(MODEL_NAME, attn_implementation="sdpa")
+            log.info("  Using SDPA attention")
+        except (TypeError, ValueError, ImportError) as e:
+            log.info("  SDPA attention unavailable, using eager attention: %s", e)
+            _model = AutoModel.from_pretrained(MODEL_NAME)
+        
+        _precision = resolve_precision()
+        if _precision == "bf16":
+            # Half the weight bandwidth, native kernels on AVX512-BF16/AMX CPUs
+            log.info("  Using bfloat16 weights")
+            _model = _model.to(dtype=torch.bfloat16)
+        elif _precision == "int8":
+            # Apply INT8 quantization for speed
+            try:
+                log.info("  Applying quantization...")
+                _model = torch.quantization.quantize_dynamic(
+                    _model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                log.info("  Quantization successful (2-3x speedup)")
+            except Exception as e:
+                log.warning("Quantization failed, using full precision: %s", e)
+                _precision = "fp32"
+        
+        # Dynamically quantized modules only run on the CPU
+        if torch.cuda.is_available() and _precision != "int8":
+            log.info("  Using CUDA GPU")
+            _model = _model.to("cuda")
+        
+        _model.eval()
+        warm_up(_tokenizer, _model)
         _model_loaded = True
-        print("BERT model ready!")
+        log.info("BERT model ready!")
         
         return _tokenizer, _model
         
     except Exception as e:
-        print(f"ERROR: Could not load BERT model: {e}")
-        print("Make sure you have: pip install torch transformers")
+        log.error("Could not load BERT model: %s (make sure you have: pip install torch transformers)", e)
         return None, None
 
 
+def warm_up(tokenizer, model):
+    """
+    Run one small dummy batch so kernel selection and primitive caching
+    (oneDNN/MKL, ONNX Runtime) happen at load time, not on the first real batch
+    """
+    inputs = tokenizer(["Warm-up section title", "Warm-up text"], padding=True, return_tensors="pt")
+    get_multi_layer_embeddings(model, inputs)
+
+def pin_threads():
+    """
+    Pin torch to one intra-op thread per physical core (RANKER_THREADS
+    overrides, e.g. a collection worker's share of the cores); hyperthreads
+    and inter-op threads only add contention for CPU inference
+    """
+    num_threads = int(os.environ.get("RANKER_THREADS") or 0)
+    if not num_threads:
+        try:
+            import psutil
+            num_threads = psutil.cpu_count(logical=False) or 0
+        except ImportError:
+            pass
+        num_threads = num_threads or os.cpu_count() or 1
+    
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Only settable before the first parallel work in this process
+    log.info("  Using %d CPU threads", num_threads)
+
+def resolve_precision():
+    """
+    Resolve RANKER_PRECISION ("auto" checks the GPU or CPU for bfloat16 support)
+    """
+    if PRECISION != "auto":
+        return PRECISION
+    
+    if torch.cuda.is_available():
+        return "bf16" if torch.cuda.is_bf16_supported() else "fp32"
+    
+    bf16_supported = getattr(torch.cpu, "_is_avx512_bf16_supported", lambda: False)
+    return "bf16" if bf16_supported() else "int8"
+
+def embedding_cache_name():
+    """
+    Embedding cache namespace: vectors differ between precisions and are
+    stored in EMBEDDING_DTYPE, so each combination gets its own store
+    """
+    return f"{MODEL_NAME}-{_precision or resolve_precision()}-{STORAGE_DTYPE}"
+
+class _LayerReadout(torch.nn.Module):
+    """
+    Export wrapper: returns only the [CLS] vectors of the last 4 layers,
+    so the ONNX graph never outputs full hidden state tensors
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, input_ids, attention_mask):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                             output_hidden_states=True)
+        return tuple(layer[:, 0, :] for layer in outputs.hidden_states[-4:])
+
+class OnnxEncoder:
+    """
+    ONNX Runtime session standing in for the torch model
+    """
+    def __init__(self, model_path):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        # Fuses attention, MatMul+Add and GELU ops
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+    
+    def embed(self, inputs):
+        """
+        Average of the last 4 layers' [CLS] vectors, shape (batch, hidden)
+        """
+        feeds = {name: inputs[name].numpy() for name in self.input_names}
+        first, *rest = self.session.run(None, feeds)
+        
+        # Accumulate in place instead of stacking the layers to average them
+        pooled = first.astype(np.float32)
+        for layer in rest:
+            pooled += layer
+        pooled *= 0.25
+        return pooled
+
+def export_onnx(model_dir=ONNX_DIR):
+    """
+    Export the model to ONNX and quantize it to INT8 (see ONNX_QUANTIZATION).
+    Runs once; later calls return the existing file.
+    """
+    int8_path = os.path.join(model_dir, f"{MODEL_NAME}-{ONNX_VARIANT}.onnx")
+    if os.path.exists(int8_path):
+        return int8_path
+    
+    from transformers import AutoTokenizer, AutoModel
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    )
+    
+    log.info("  Exporting model to ONNX (one-time)...")
+    os.makedirs(model_dir, exist_ok=True)
+    # Per-process temporary files: collection workers may export concurrently,
+    # and int8_path must only ever appear complete (moved into place at the end)
+    fp32_path = os.path.join(model_dir, f"{MODEL_NAME}.{os.getpid()}.tmp.onnx")
+    tmp_int8_path = os.path.join(model_dir, f"{MODEL_NAME}-{ONNX_VARIANT}.{os.getpid()}.tmp.onnx")
+    
+    try:
+        # Always export from full-precision weights
+        model = AutoModel.from_pretrained(MODEL_NAME).eval()
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        dummy = tokenizer(["warm up"], return_tensors="pt")
+        output_names = [f"cls_layer_{i}" for i in range(4)]
+        
+        torch.onnx.export(
+            _LayerReadout(model),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            opset_version=ONNX_OPSET,
+            input_names=["input_ids", "attention_mask"],
+            output_names=output_names,
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                **{name: {0: "batch"} for name in output_names},
+            },
+        )
+        
+        if ONNX_QUANTIZATION == "static":
+            class Calibration(CalibrationDataReader):
+                def __init__(self):
+                    self.feeds = (
+                        {name: tokenizer([text], return_tensors="np")[name].astype(np.int64)
+                         for name in ("input_ids", "attention_mask")}
+                        for text in CALIBRATION_TEXTS
+                    )
+            
+                def get_next(self):
+                    return next(self.feeds, None)
+            
+            log.info("  Calibrating static quantization on %d texts...", len(CALIBRATION_TEXTS))
+            # u8 activations with s8 weights map to VNNI int8 GEMMs on x86
+            quantize_static(
+                fp32_path, tmp_int8_path, Calibration(),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+            )
+        else:
+            quantize_dynamic(fp32_path, tmp_int8_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_int8_path, int8_path)
+    finally:
+        for path in (fp32_path, tmp_int8_path):
+            if os.path.exists(path):
+                os.remove(path)
+    log.info("  Saved %s", int8_path)
+    
+    return int8_path
+
 def extract_keywords_from_persona(persona, job_description):
     """
     Extract relevant keywords from persona and job description.
@@ -64,158 +385,155 @@ def extract_keywords_from_persona(persona, job_description):
     # Combine text for analysis
     text = f"{persona} {job_description}".lower()
     
-    # Extract words (3+ characters)
-    words = re.findall(r'\b[a-zA-Z]{3,}\b', text)
-    
-    # Common stopwords to filter out
-    stopwords = {
-        'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'can', 'had', 
-        'her', 'was', 'one', 'our', 'out', 'day', 'get', 'has', 'him', 'how', 
-        'man', 'new', 'now', 'old', 'see', 'two', 'way', 'who', 'with', 'that',
-        'this', 'will', 'any', 'may', 'say', 'she', 'use', 'each', 'which',
-        'their', 'time', 'work', 'first', 'been', 'call', 'find', 'long',
-        'down', 'right', 'look', 'only', 'come', 'over', 'think', 'also',
-        'back', 'after', 'very', 'good', 'well', 'where', 'much', 'before'
-    }
-    
-    # Filter meaningful keywords
-    keywords = [word for word in words if word not in stopwords and len(word) > 2]
+    # Extract words (3+ characters), dropping stopwords
+    keywords = (word for word in _WORD_RE.findall(text) if word not in _STOPWORDS)
     
-    # Remove duplicates while keeping order
-    unique_keywords = []
-    seen = set()
-    for keyword in keywords:
-        if keyword not in seen:
-            seen.add(keyword)
-            unique_keywords.append(keyword)
-    
-    # Return top keywords for efficiency
-    return unique_keywords[:12]
+    # Remove duplicates while keeping order, top keywords for efficiency
+    return list(dict.fromkeys(keywords))[:12]
 
 def expand_query_semantically(keywords):
     """
     Expand query with semantic synonyms for better matching
     """
-    # Comprehensive synonym mapping
-    synonym_map = {
-        # Food & Cooking
-        'food': ['recipe', 'dish', 'meal', 'cuisine', 'cooking', 'culinary'],
-        'recipe': ['dish', 'meal', 'food', 'cooking', 'preparation'],
-        'vegetarian': ['plant-based', 'vegan', 'meatless', 'veggie'],
-        'cooking': ['preparation', 'culinary', 'recipe', 'kitchen'],
-        'menu': ['dishes', 'options', 'selection', 'offerings'],
-        'buffet': ['self-service', 'spread', 'selection'],
-        
-        # Travel & Tourism
-        'travel': ['trip', 'journey', 'vacation', 'tourism', 'visit'],
-        'trip': ['journey', 'travel', 'vacation', 'excursion'],
-        'vacation': ['holiday', 'trip', 'travel', 'getaway'],
-        'itinerary': ['schedule', 'plan', 'agenda', 'program'],
-        'tourist': ['visitor', 'traveler', 'sightseer'],
-        'cultural': ['heritage', 'historical', 'traditional'],
-        
-        # Business & Corporate
-        'corporate': ['business', 'company', 'office', 'professional'],
-        'business': ['corporate', 'company', 'commercial', 'professional'],
-        'gathering': ['meeting', 'event', 'function', 'assembly'],
-        'professional': ['business', 'corporate', 'work'],
-        
-        # Documents & Management
-        'document': ['file', 'pdf', 'form', 'paper', 'report'],
-        'management': ['administration', 'organization', 'coordination'],
-        'plan': ['organize', 'schedule', 'arrange', 'design', 'prepare'],
-        'create': ['make', 'build', 'generate', 'produce', 'develop'],
-        'prepare': ['make', 'create', 'organize', 'arrange'],
-        
-        # Actions & Processes
-        'organize': ['arrange', 'plan', 'coordinate', 'manage'],
-        'arrange': ['organize', 'plan', 'set up', 'coordinate'],
-        'schedule': ['plan', 'organize', 'arrange', 'time'],
-        'coordinate': ['organize', 'manage', 'arrange'],
-    }
-    
-    expanded_terms = set(keywords)
+    # Ordered de-duplication keeps the query text (and its cache key) stable
+    expanded_terms = dict.fromkeys(keywords)
     
     # Add synonyms for each keyword
     for keyword in keywords:
-        if keyword in synonym_map:
-            # Add top 2-3 synonyms to avoid query bloat
-            expanded_terms.update(synonym_map[keyword][:3])
+        if keyword in _TOP_SYNONYMS:
+            expanded_terms.update(_TOP_SYNONYMS[keyword])
     
     return list(expanded_terms)
 
-def get_multi_layer_embeddings(model, inputs):
+def build_query(persona, job_description, expanded_keywords):
+    """
+    Build the enhanced query text that is embedded for ranking
+    """
+    query_parts = [persona, job_description] + expanded_keywords[:8]
+    return ' '.join(query_parts)
+
+def encode_query(persona, job_description):
+    """
+    Embed the persona/job query once per (persona, job) pair.
+    Later calls reuse the in-memory vector; the embedding cache
+    also persists it across runs.
+    """
+    cache_key = (persona, job_description)
+    if cache_key not in _query_cache:
+        tokenizer, model = load_bert_model()
+        if not tokenizer or not model:
+            return None
+        
+        keywords = extract_keywords_from_persona(persona, job_description)
+        query = build_query(persona, job_description, expand_query_semantically(keywords))
+        _query_cache[cache_key] = process_texts_in_batches([query], tokenizer, model)[0]
+    
+    return _query_cache[cache_key]
+
+class _EarlyExit(Exception):
+    """
+    Raised by a forward hook to stop the model after the pooled layers
+    """
+
+def get_multi_layer_embeddings(model, inputs, depth=None):
     """
     Extract and combine multiple transformer layers for richer representations
     Uses proven technique of averaging last 4 layers
+    (of the first `depth` layers when set, skipping the rest)
     """
-    with torch.no_grad():
-        outputs = model(**inputs, output_hidden_states=True)
-        
-        # Get hidden states from all layers
-        hidden_states = outputs.hidden_states
-        
-        # Take the last 4 layers and average them
-        # This captures both low-level and high-level features
-        last_4_layers = torch.stack(hidden_states[-4:])  # Shape: (4, batch, seq, hidden)
-        
-        # Average across layers, then take [CLS] token (first token)
-        averaged_embeddings = torch.mean(last_4_layers, dim=0)[:, 0, :]  # Shape: (batch, hidden)
-        
-        return averaged_embeddings.numpy()
+    if isinstance(model, OnnxEncoder):
+        return model.embed(inputs)
+    
+    # Hooks on the last 4 layers add their [CLS] vectors into one buffer, so
+    # no per-layer hidden states are returned, kept or stacked
+    inputs = {name: tensor.to(model.device, non_blocking=True) for name, tensor in inputs.items()}
+    pooled = torch.zeros(inputs["input_ids"].shape[0], model.config.hidden_size, device=model.device)
+    
+    def accumulate(module, args, output):
+        hidden = output[0] if isinstance(output, tuple) else output
+        pooled.add_(hidden[:, 0, :])
+    
+    def exit_early(module, args, output):
+        raise _EarlyExit
+    
+    layers = model.encoder.layer[:depth]
+    hooks = [layer.register_forward_hook(accumulate) for layer in layers[-4:]]
+    if len(layers) < len(model.encoder.layer):
+        hooks.append(layers[-1].register_forward_hook(exit_early))
+    try:
+        with torch.inference_mode():
+            model(**inputs)
+    except _EarlyExit:
+        pass
+    finally:
+        for hook in hooks:
+            hook.remove()
+    
+    return pooled.div_(4).cpu().numpy()
 
-def rank_sections(sections, persona, job_description):
+def rank_sections(sections, persona, job_description, query_embedding=None,
+                  tokenizer=None, model=None):
     """
-    Main ranking function using improved BERT
+    Main ranking function using improved BERT.
+    Pass query_embedding (from encode_query) to skip encoding the query,
+    and a preloaded tokenizer/model to skip the model lookup.
     """
     # Initialize BERT model if not already done
-    tokenizer, model = load_bert_model()
+    if tokenizer is None or model is None:
+        tokenizer, model = load_bert_model()
     
     if not tokenizer or not model:
-        print("❌ BERT model not available, cannot rank sections")
+        log.error("BERT model not available, cannot rank sections")
         return [], []
     
     if not sections:
-        print("⚠️  No sections to rank")
+        log.warning("No sections to rank")
         return [], []
     
     try:
-        print(f"🧠 Ranking {len(sections)} sections with Improved BERT...")
+        log.info("🧠 Ranking %d sections with Improved BERT...", len(sections))
         start_time = time.time()
         
         # Enhanced section filtering
         filtered_sections = filter_sections_for_bert(sections)
-        print(f"   📊 Filtered to {len(filtered_sections)} high-quality sections")
+        log.info("   📊 Filtered to %d high-quality sections", len(filtered_sections))
         
         if not filtered_sections:
-            print("⚠️  No sections remain after filtering")
+            log.warning("No sections remain after filtering")
             return [], []
         
         # Dynamic persona analysis
         keywords = extract_keywords_from_persona(persona, job_description)
         expanded_keywords = expand_query_semantically(keywords)
         
-        print(f"   🎯 Extracted {len(keywords)} persona keywords")
-        print(f"   🔍 Expanded to {len(expanded_keywords)} semantic terms")
-        print(f"   📝 Sample keywords: {keywords[:5]}")
+        log.info("   🎯 Extracted %d persona keywords", len(keywords))
+        log.info("   🔍 Expanded to %d semantic terms", len(expanded_keywords))
+        log.info("   📝 Sample keywords: %s", keywords[:5])
+        
+        # Query embedding is computed once per persona/job
+        if query_embedding is None:
+            query_embedding = encode_query(persona, job_description)
         
-        # Create enhanced query
-        query_parts = [persona, job_description] + expanded_keywords[:8]
-        enhanced_query = ' '.join(query_parts).lower()
+        # Early-exit first stage keeps only the most promising sections
+        if RERANK_K and len(filtered_sections) > RERANK_K and not isinstance(model, OnnxEncoder):
+            query = build_query(persona, job_description, expanded_keywords)
+            filtered_sections = shallow_prefilter(filtered_sections, query, tokenizer, model)
+            log.info("   ⏩ Kept top %d sections from a %d-layer pass", len(filtered_sections), SHALLOW_LAYERS)
+        
+        # Fields read by text preparation and boosting, lowercased once
+        columns = section_columns(filtered_sections)
         
         # Prepare texts for BERT processing
-        texts = prepare_texts_for_bert(filtered_sections, enhanced_query)
+        texts = prepare_texts_for_bert(columns)
         
         # Process in batches for efficiency
-        embeddings = process_texts_in_batches(texts, tokenizer, model)
+        section_embeddings = process_texts_in_batches(texts, tokenizer, model)
         
         # Calculate similarities
-        query_embedding = embeddings[0:1]
-        section_embeddings = embeddings[1:]
-        similarities = cosine_similarity(query_embedding, section_embeddings).flatten()
+        similarities = cosine_scores(query_embedding, section_embeddings)
         
         # Apply persona-aware boosting
-        similarities = apply_persona_boosting(similarities, filtered_sections, expanded_keywords)
+        similarities = apply_persona_boosting(similarities, columns, expanded_keywords)
         
         # Create ranked results
         ranked_sections, subsection_analysis = create_ranked_results(
@@ -225,51 +543,65 @@ def rank_sections(sections, persona, job_description):
         processing_time = time.time() - start_time
         speed = len(sections) / processing_time if processing_time > 0 else 0
         
-        print(f"   ⏱️  Processing time: {processing_time:.3f}s")
-        print(f"   ⚡ Speed: {speed:.1f} sections/second")
-        print(f"   🏆 Top result: '{ranked_sections[0]['section_title'][:50]}...'" if ranked_sections else "No results")
+        log.info("   ⏱️  Processing time: %.3fs", processing_time)
+        log.info("   ⚡ Speed: %.1f sections/second", speed)
+        if ranked_sections:
+            log.info("   🏆 Top result: '%s...'", ranked_sections[0]['section_title'][:50])
+        else:
+            log.info("   No results")
         
         return ranked_sections, subsection_analysis
         
     except Exception as e:
-        print(f"❌ Error in BERT ranking: {e}")
+        log.error("Error in BERT ranking: %s", e)
         return [], []
 
-def filter_sections_for_bert(sections):
+def shallow_prefilter(sections, query, tokenizer, model, k=None):
     """
-    Filter sections for optimal BERT processing
+    Score sections with only the first SHALLOW_LAYERS layers and keep
+    the top k (RERANK_K) for the full model, in their original order
     """
-    filtered = []
+    texts = prepare_texts_for_bert(section_columns(sections))
+    embeddings = encode_texts([query] + texts, tokenizer, model, depth=SHALLOW_LAYERS)
+    scores = cosine_scores(embeddings[0], embeddings[1:])
     
-    for section in sections:
-        title = section.get("section_title", "").strip()
-        text = section.get("section_text", "").strip()
-        
-        # Quality filters
+    keep = np.sort(np.argsort(-scores, kind="stable")[:k or RERANK_K])
+    return [sections[idx] for idx in keep]
+
+def filter_sections_for_bert(sections, limit=20):
+    """
+    Filter sections for optimal BERT processing.
+    Keeps the first `limit` passing sections (BERT is computationally
+    expensive), so scanning stops as soon as they are found.
+    """
+    def fields():
+        for section in sections:
+            yield section, section.get("section_title", "").strip(), section.get("section_text", "").strip()
+    
+    # Quality filters
+    filtered = list(islice((
+        section for section, title, text in fields()
         if (len(title) >= 3 and 
             len(text) >= 20 and 
             len(text) <= 1000 and  # BERT works best with reasonable length
-            not is_low_quality_section(title, text)):
-            filtered.append(section)
+            not is_low_quality_section(title, text))
+    ), limit))
     
     # If too few sections, relax filters
     if len(filtered) < 5:
-        filtered = []
-        for section in sections:
-            title = section.get("section_title", "").strip()
-            text = section.get("section_text", "").strip()
-            if len(title) >= 2 and len(text) >= 15:
-                filtered.append(section)
+        filtered = list(islice((
+            section for section, title, text in fields()
+            if len(title) >= 2 and len(text) >= 15
+        ), limit))
     
-    # Limit for efficiency (BERT is computationally expensive)
-    return filtered[:20]
+    return filtered
 
 def is_low_quality_section(title, text):
     """
     Detect low-quality sections to filter out
     """
     # Skip sections that are mostly numbers or symbols
-    if len(re.sub(r'[^a-zA-Z\s]', '', text)) < len(text) * 0.6:
+    if letter_space_count(text) < len(text) * 0.6:
         return True
     
     # Skip very repetitive content
@@ -283,69 +615,188 @@ def is_low_quality_section(title, text):
     
     return False
 
-def prepare_texts_for_bert(sections, query):
+def letter_space_count(text):
+    """
+    Count ASCII letters and whitespace in a string
+    (same result as len(re.sub(r'[^a-zA-Z\s]', '', text)), without the regex pass)
+    """
+    count = len(text.encode('ascii', 'ignore').translate(None, _NON_LETTER_SPACE_BYTES))
+    if not text.isascii():
+        count += len(_UNICODE_SPACE_RE.findall(text))
+    return count
+
+def section_columns(sections):
+    """
+    Lay out the section fields the ranker reads as parallel lists
+    (one entry per section); lowercased copies are made once, for keyword matching
+    """
+    return {
+        "titles": [section.get("section_title", "") for section in sections],
+        "texts": [section.get("section_text", "") for section in sections],
+        "titles_lower": [section.get("section_title", "").lower() for section in sections],
+        "texts_lower": [section.get("section_text", "").lower() for section in sections],
+        "types": [section.get("section_type", "") for section in sections],
+    }
+
+def prepare_texts_for_bert(columns):
     """
     Prepare texts for optimal BERT processing
     """
-    texts = [query]  # Query goes first
+    texts = []
     
-    for section in sections:
-        title = section.get("section_title", "")
-        text = section.get("section_text", "")
-        
+    for title, text in zip(columns["titles"], columns["texts"]):
         # Enhanced text preparation
-        # Title gets extra weight by repetition
-        enhanced_text = f"{title} {title} {text}".lower()
-        
-        # Truncate to optimal length for RoBERTa (512 tokens ≈ 400 words)
-        words = enhanced_text.split()
-        if len(words) > 350:
-            enhanced_text = ' '.join(words[:350]) + "..."
+        # Title first, set off by the separator token; case is kept since
+        # RoBERTa's BPE vocabulary is case-sensitive
+        enhanced_text = f"{title}{TITLE_SEPARATOR}{text}"
         
-        texts.append(enhanced_text)
+        # Cheap pre-cut; the tokenizer truncates exactly at 512 tokens
+        texts.append(enhanced_text[:MAX_INPUT_CHARS])
     
     return texts
 
-def process_texts_in_batches(texts, tokenizer, model, batch_size=8):
+def dynamic_batch_size(max_tokens):
     """
-    Process texts in batches for memory efficiency
+    Pick a batch size from the longest sequence in a batch.
+    Short batches can be wide, long ones stay narrow to bound memory.
+    """
+    if max_tokens <= 64:
+        return 64
+    if max_tokens <= 128:
+        return 32
+    if max_tokens <= 256:
+        return 16
+    return 8
+
+def process_texts_in_batches(texts, tokenizer, model, batch_size=None):
     """
-    all_embeddings = []
+    Embed texts, reusing cached embeddings from earlier runs.
+    Only cache misses go through BERT; new embeddings are written back.
+    """
+    cache_name = embedding_cache_name()
+    keys = [embed_cache.make_key(cache_name, text) for text in texts]
+    embeddings = embed_cache.get_many(cache_name, keys, dtype=EMBEDDING_DTYPE)
+    
+    missing = [idx for idx, key in enumerate(keys) if key not in embeddings]
+    if missing:
+        new_embeddings = encode_texts([texts[idx] for idx in missing], tokenizer, model, batch_size)
+        new_items = {keys[idx]: vec for idx, vec in zip(missing, new_embeddings)}
+        embed_cache.put_many(cache_name, new_items, dtype=EMBEDDING_DTYPE)
+        embeddings.update(new_items)
+    
+    if len(missing) < len(texts):
+        log.info("   💾 Embedding cache hits: %d/%d", len(texts) - len(missing), len(texts))
+    
+    # Fill one preallocated matrix instead of stacking and converting
+    result = np.empty((len(keys), len(embeddings[keys[0]])), dtype=EMBEDDING_DTYPE)
+    for row, key in enumerate(keys):
+        result[row] = embeddings[key]
+    return result
+
+def encode_texts(texts, tokenizer, model, batch_size=None, depth=None):
+    """
+    Process texts in length-sorted batches to minimize padding.
+    Batch size is chosen per batch via dynamic_batch_size unless fixed.
+    depth limits the layers run (see get_multi_layer_embeddings).
+    """
+    embeddings = None
+
+    # Tokenize everything once (RoBERTa's max length), unpadded
+    encoded = tokenizer(texts, truncation=True, max_length=512)
     
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i+batch_size]
-        
-        # Tokenize batch
-        inputs = tokenizer(
-            batch_texts,
+    # Sort by token length so each batch pads to a similar length
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+    order = np.argsort(lengths, kind="stable")
+
+    i = 0
+    while i < len(order):
+        size = batch_size
+        if size is None:
+            # Texts are sorted, so the last one in a batch is the longest
+            size = 64
+            while size > 8:
+                longest = lengths[order[min(i + size, len(order)) - 1]]
+                if dynamic_batch_size(longest) >= size:
+                    break
+                size //= 2
+
+        batch_order = order[i:i+size]
+        i += size
+
+        # Pad the batch's pre-tokenized inputs to its longest sequence
+        inputs = tokenizer.pad(
+            {name: [encoded[name][idx] for idx in batch_order]
+             for name in ("input_ids", "attention_mask")},
             padding=True,
-            truncation=True,
-            max_length=512,  # RoBERTa's max length
             return_tensors="pt"
         )
         
         # Get multi-layer embeddings
-        batch_embeddings = get_multi_layer_embeddings(model, inputs)
-        all_embeddings.append(batch_embeddings)
+        batch_embeddings = get_multi_layer_embeddings(model, inputs, depth)
+        
+        # Write rows straight to their original text positions
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+        embeddings[batch_order] = batch_embeddings
+    
+    return embeddings
+
+def cosine_scores(query_embedding, section_embeddings):
+    """
+    Cosine similarity of the query against every section as one
+    matrix-vector product over L2-normalized rows (computed in float32)
+    """
+    query = query_embedding.astype(np.float32).ravel()
+    query /= max(np.linalg.norm(query), 1e-8)
     
-    # Combine all embeddings
-    return np.vstack(all_embeddings)
+    sections = section_embeddings.astype(np.float32)
+    sections /= np.maximum(np.linalg.norm(sections, axis=1, keepdims=True), 1e-8)
+    
+    return sections @ query
+
+def keyword_counter(keywords):
+    """
+    Build a function counting how many of the keywords occur in a string,
+    using one regex scan instead of a substring test per keyword
+    """
+    if not keywords:
+        return lambda text: 0
+    
+    # Lookahead matches overlap; longest-first alternation reports the longest
+    # keyword at each position, and the shorter keywords it starts with are
+    # added from `implied`
+    alternation = '|'.join(map(re.escape, sorted(keywords, key=len, reverse=True)))
+    pattern = re.compile(f'(?=({alternation}))')
+    implied = {k: frozenset(p for p in keywords if k.startswith(p)) for k in keywords}
+    
+    def count(text):
+        found = set()
+        for match in pattern.finditer(text):
+            found |= implied[match.group(1)]
+        return len(found)
+    
+    return count
 
-def apply_persona_boosting(similarities, sections, expanded_keywords):
+def apply_persona_boosting(similarities, columns, expanded_keywords):
     """
     Apply persona-aware boosting to similarity scores
     """
     boosted_similarities = similarities.copy()
+    count_matches = keyword_counter(expanded_keywords)
     
-    for i, section in enumerate(sections):
-        title_lower = section.get("section_title", "").lower()
-        text_lower = section.get("section_text", "").lower()
-        
+    # Domain boosts depend only on the query, so decide them once
+    keyword_text = ' '.join(expanded_keywords)
+    food_query = any(food_word in keyword_text for food_word in ['food', 'recipe', 'vegetarian', 'menu'])
+    procedural_query = any(proc_word in keyword_text for proc_word in ['plan', 'organize', 'prepare', 'create'])
+    
+    for i, (title_lower, text_lower, section_type) in enumerate(
+        zip(columns["titles_lower"], columns["texts_lower"], columns["types"])
+    ):
         boost_factor = 1.0
         
         # Count keyword matches
-        title_matches = sum(1 for keyword in expanded_keywords if keyword in title_lower)
-        text_matches = sum(1 for keyword in expanded_keywords if keyword in text_lower)
+        title_matches = count_matches(title_lower)
+        text_matches = count_matches(text_lower)
         
         # Apply graduated boosting
         if title_matches > 0:
@@ -355,13 +806,12 @@ def apply_persona_boosting(similarities, sections, expanded_keywords):
             boost_factor += 0.1 + (text_matches * 0.05)
         
         # Special domain-specific boosts
-        section_type = section.get("section_type", "")
         if section_type in ["recipe_component", "complete_recipe", "individual_recipe"]:
-            if any(food_word in ' '.join(expanded_keywords) for food_word in ['food', 'recipe', 'vegetarian', 'menu']):
+            if food_query:
                 boost_factor += 0.2
         
         if section_type in ["heading_based", "procedural"]:
-            if any(proc_word in ' '.join(expanded_keywords) for proc_word in ['plan', 'organize', 'prepare', 'create']):
+            if procedural_query:
                 boost_factor += 0.15
         
         boosted_similarities[i] *= boost_factor
@@ -372,18 +822,19 @@ def create_ranked_results(similarities, sections, original_section_count):
     """
     Create final ranked results with proper formatting
     """
-    # Combine similarities with sections
-    section_scores = list(zip(similarities, sections))
-    section_scores.sort(reverse=True, key=lambda x: x[0])
+    max_results = min(15, len(sections))
+    if not max_results:
+        return [], []
     
-    # Limit results
-    max_results = min(15, len(section_scores))
-    section_scores = section_scores[:max_results]
+    # Stable sort so tied scores keep section order (at most 20 candidates,
+    # so a full sort costs nothing over partial selection)
+    top = np.argsort(-similarities, kind="stable")[:max_results]
     
     ranked_sections = []
     subsection_analysis = []
     
-    for rank, (score, section) in enumerate(section_scores, start=1):
+    for rank, idx in enumerate(top, start=1):
+        score, section = similarities[idx], sections[idx]
         # Ranked section entry
         ranked_sections.append({
             "document": section["document"],
@@ -461,4 +912,5 @@ def test_bert_ranking():
     print("✅ BERT ranking test complete!")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     test_bert_ranking()